@@ -8,7 +8,121 @@ __author__: Conor Heins, Alexander Tschantz, Brennan Klein
 """
 
 import numpy as np
-import warnings
+from scipy.special import digamma
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# parallel loops run serially when `numba` is not installed
+_prange = numba.prange if numba is not None else range
+
+# minimum value used to avoid division by zero and `log(0)`
+_EPS = np.exp(-16)
+
+# below this size, the dispatch overhead of `numba` (parallel threads) outweighs the compiled evaluation
+_NUMBA_MIN_SIZE = 4096
+
+
+def _normalize_2d(values, normed):
+    """ Normalize the columns of a C-contiguous 2D array (into `normed`) in two row-major passes
+
+    Columns which sum to zero are replaced by a uniform distribution.
+    When `numba` is installed, this is compiled (see `_normalize_2d_njit`),
+    otherwise it runs as (slow) plain Python
+    """
+    n_rows, n_cols = values.shape
+    column_sums = np.zeros(n_cols)
+    for i in range(n_rows):
+        for j in range(n_cols):
+            column_sums[j] += values[i, j]
+
+    scales = np.empty(n_cols)
+    is_empty = np.zeros(n_cols, dtype=np.bool_)
+    for j in range(n_cols):
+        if column_sums[j] == 0.0:
+            is_empty[j] = True
+            scales[j] = 1.0 / n_rows
+        else:
+            scales[j] = 1.0 / column_sums[j]
+
+    for i in _prange(n_rows):
+        for j in range(n_cols):
+            if is_empty[j]:
+                normed[i, j] = scales[j]
+            else:
+                normed[i, j] = values[i, j] * scales[j]
+    return normed
+
+
+if numba is not None:
+    _normalize_2d_njit = numba.njit(parallel=True, fastmath=True, cache=True)(_normalize_2d)
+else:
+    _normalize_2d_njit = None
+
+
+def _wnorm(values, axis=0):
+    """ Compute 1 / sum(A) - 1 / A (summing along `axis`), where A = values + exp(-16)
+
+    Only one full-size array is allocated, the reciprocal and subtraction are done in place
+    """
+    A = values + _EPS
+    inv_sum = np.reciprocal(A.sum(axis=axis, keepdims=True))
+    inv_A = np.reciprocal(A, out=A)
+    return np.subtract(inv_sum, inv_A, out=inv_A)
+
+
+def _log(values, out):
+    """ Take the log of `values` into `out`, clamping exact zeros to exp(-16)
+
+    Other values (including values below exp(-16), or negative values) are passed to `np.log` unchanged
+    """
+    np.copyto(out, values)
+    np.copyto(out, _EPS, where=values == 0.0)
+    return np.log(out, out=out)
+
+
+def _expected_entropy(values, axis=0):
+    """ Expected entropy of the Categorical distributions parameterized by `values` along `axis`
+
+    Uses the closed form E[H] = digamma(a_0 + 1) - sum_i (a_i / a_0) * digamma(a_i + 1),
+    where a_0 is the sum along `axis` (i.e. the sum of each column, for `axis=0`)
+
+    As in `wnorm`, exp(-16) is added to the parameters to avoid division by zero,
+    so columns of zeros give an expected entropy of (approximately) zero, its limiting value
+    """
+    alpha = values + _EPS
+    alpha_0 = alpha.sum(axis=axis, keepdims=True)
+    weighted = (alpha / alpha_0) * digamma(alpha + 1.0)
+    entropy = digamma(alpha_0 + 1.0) - weighted.sum(axis=axis, keepdims=True)
+    return entropy.squeeze(axis)
+
+
+def _empty_like_factors(arrays, flat=None):
+    """ Allocate an `array-of-array` shaped like `arrays`, backed by a single flat buffer
+
+    Parameters
+    ----------
+    arrays: iterable of np.ndarray
+        The factors whose shapes are used
+    flat: np.ndarray (optional)
+        1D buffer with the total size of `arrays`, used instead of allocating a new one
+
+    Returns
+    ----------
+    np.ndarray
+        Object array where each entry is an (uninitialized) view into one buffer
+    """
+    arrays = list(arrays)
+    if flat is None:
+        flat = np.empty(sum(array.size for array in arrays))
+    values = np.empty(len(arrays), dtype="object")
+    offset = 0
+    for i, array in enumerate(arrays):
+        values[i] = flat[offset : offset + array.size].reshape(array.shape)
+        offset += array.size
+    return values
 
 
 class Dirichlet(object):
@@ -17,6 +131,10 @@ class Dirichlet(object):
 
         `IS_AOA` refers to whether this class uses the `array-of-array` formulation
 
+        The parameters are stored as C-contiguous float64 arrays (flagged by `_contig`),
+        so that downstream operations run on contiguous memory. Assigning a new
+        (e.g. strided) array to `values` directly bypasses this guarantee
+
         Parameters
         ----------
         dims: list of int _or_ list of list (where each list is a list of int)
@@ -28,6 +146,17 @@ class Dirichlet(object):
 
         self.IS_AOA = False
 
+        # in the `array-of-array` formulation, all factors are views into `_flat`
+        self._flat = None
+        self._slices = []
+        self._factors = []
+        # when all factors share a shape, `_stacked` is a (n_factors, *shape) view of `_flat`
+        self._stacked = None
+        self._contig = True
+
+        # output buffers which are reused across calls, see `_get_output`
+        self._out_cache = {}
+
         if values is not None and dims is not None:
             raise ValueError("please provide _either_ :dims: or :values:, not both")
 
@@ -56,15 +185,19 @@ class Dirichlet(object):
             self.IS_AOA = True
 
         if self.IS_AOA:
-            self.values = np.empty(len(values), dtype="object")
-            for i, array in enumerate(values):
+            arrays = []
+            for array in values:
                 if array.ndim == 1:
-                    values[i] = np.expand_dims(values[i], axis=1)
-                self.values[i] = values[i].astype("float64")
+                    array = np.expand_dims(array, axis=1)
+                arrays.append(array)
+            self.construct_flat([array.shape for array in arrays])
+            for factor, array in zip(self._factors, arrays):
+                factor[...] = array
         else:
             if values.ndim == 1:
                 values = np.expand_dims(values, axis=1)
-            self.values = values.astype("float64")
+            self.values = np.array(values, dtype=np.float64, order="C")
+        self._contig = True
 
     def construct_dims(self, dims):
         """Initialize a Dirichlet distribution with `values` argument
@@ -85,12 +218,13 @@ class Dirichlet(object):
                 self.IS_AOA = True
 
             if self.IS_AOA:
-                self.values = np.empty(len(dims), dtype="object")
+                shapes = []
                 for i in range(len(dims)):
                     if len(dims[i]) == 1:
-                        self.values[i] = np.zeros([dims[i][0], 1])
+                        shapes.append((dims[i][0], 1))
                     else:
-                        self.values[i] = np.zeros(dims[i])
+                        shapes.append(tuple(dims[i]))
+                self.construct_flat(shapes)
             else:
                 if len(dims) == 1:
                     self.values = np.zeros([dims[0], 1])
@@ -101,26 +235,189 @@ class Dirichlet(object):
         else:
             raise ValueError(":dims: must be either :list: or :int:")
 
-    def normalize(self):
+    def construct_flat(self, shapes):
+        """Allocate the parameters of an `array-of-array` Dirichlet as a single buffer
+
+        The parameters of all factors are stored contiguously in `_flat` (initialized to zero),
+        and each entry of `values` is a view into this buffer
+
+        Parameters
+        ----------
+        shapes: list of tuple
+            The shape of each factor
+        """
+        sizes = [int(np.prod(shape)) for shape in shapes]
+        offsets = np.cumsum([0] + sizes)
+        self._slices = [
+            (slice(offsets[i], offsets[i + 1]), shape) for i, shape in enumerate(shapes)
+        ]
+        self._flat = np.zeros(offsets[-1])
+        self.values = self._unflatten(self._flat)
+        self._factors = list(self.values)
+        if len(shapes) > 0 and all(shape == shapes[0] for shape in shapes):
+            self._stacked = self._flat.reshape((len(shapes),) + tuple(shapes[0]))
+
+    def _unflatten(self, flat):
+        """Split a flat buffer into an `array-of-array` laid out like this distribution
+
+        Parameters
+        ----------
+        flat: np.ndarray
+            1D array with the same size as `_flat`
+
+        Returns
+        ----------
+        np.ndarray
+            Object array where each entry is a (reshaped) view into `flat`
+        """
+        values = np.empty(len(self._slices), dtype="object")
+        for i, (flat_slice, shape) in enumerate(self._slices):
+            values[i] = flat[flat_slice].reshape(shape)
+        return values
+
+    def _flat_values(self):
+        """Return the contiguous buffer backing the factors, if it is still valid
+
+        The buffer is invalidated when `values` (or one of its entries) is replaced
+        rather than modified in place, or when the factors are no longer views into `_flat`,
+        in which case `None` is returned
+
+        """
+        if self._flat is None or len(self.values) != len(self._factors):
+            return None
+        for array, factor in zip(self.values, self._factors):
+            if array is not factor or factor.base is not self._flat:
+                return None
+        return self._flat
+
+    def _stacked_values(self):
+        """Return the factors stacked along a new leading axis, if they share a shape
+
+        This is a view of `_flat`, so `None` is returned whenever `_flat_values` is `None`
+
+        """
+        if self._stacked is None or self._flat_values() is None:
+            return None
+        return self._stacked
+
+    def _from_flat(self, flat):
+        """Create an `array-of-array` Dirichlet which shares the layout of this one
+
+        Parameters
+        ----------
+        flat: np.ndarray
+            1D array with the same size as `_flat`, used as the parameters (without copying)
+        """
+        dirichlet = Dirichlet._from_view(self._unflatten(flat))
+        dirichlet._flat = flat
+        dirichlet._slices = self._slices
+        dirichlet._factors = list(dirichlet.values)
+        if self._stacked is not None:
+            dirichlet._stacked = flat.reshape(self._stacked.shape)
+        return dirichlet
+
+    @classmethod
+    def _from_view(cls, values):
+        """Wrap `values` in a Dirichlet without validating, expanding or copying them
+
+        Only for arrays which are already trusted (i.e. float64 arrays of at least 2 dimensions,
+        or an `array-of-array` of such arrays), such as slices or results of this class
+
+        Parameters
+        ----------
+        values: np.ndarray
+            The parameters of the distribution (shared, not copied)
+        """
+        dirichlet = cls.__new__(cls)
+        dirichlet.IS_AOA = values.dtype == object
+        dirichlet.values = values
+        dirichlet._flat = None
+        dirichlet._slices = []
+        dirichlet._factors = []
+        dirichlet._stacked = None
+        dirichlet._contig = values.flags.c_contiguous
+        dirichlet._out_cache = {}
+        return dirichlet
+
+    def _get_output(self, name, shape, reuse_output):
+        """ Return an uninitialized float64 output buffer of shape `shape`
+
+        If `reuse_output`, the buffer is cached per method `name` and shape,
+        and the same buffer is returned on subsequent calls
+
+        """
+        if not reuse_output:
+            return np.empty(shape)
+        key = (name, shape)
+        out = self._out_cache.get(key)
+        if out is None:
+            out = np.empty(shape)
+            self._out_cache[key] = out
+        return out
+
+    def normalize(self, reuse_output=False):
         """ Normalize distribution
 
         This function will ensure the distribution(s) integrate to 1.0
         In the case `ndims` >= 2, normalization is performed along the columns of the arrays
 
+        Parameters
+        ----------
+        reuse_output: bool
+            Whether to write the result into a buffer owned by this Dirichlet, which is reused
+            by subsequent calls (avoiding an allocation per call). The returned array is then
+            overwritten by the next call, so it must be copied by the caller if retained
         """
-        if self.IS_AOA:
-            normed = np.empty(len(self.values), dtype=object)
-            for i in range(len(self.values)):
-                array_i = self.values[i]
-                column_sums = np.sum(array_i, axis=0)
-                array_i = np.divide(array_i, column_sums)
-                array_i[np.isnan(array_i)] = np.divide(1.0, array_i.shape[0])
-                normed[i] = array_i
+        stacked = self._stacked_values()
+        if stacked is not None:
+            # all factors share a shape, so they are normalized in a single pass
+            normed_flat = self._get_output("normalize", (stacked.size,), reuse_output)
+            block = normed_flat.reshape(stacked.shape)
+            column_sums = stacked.sum(axis=1, keepdims=True)
+            is_empty = column_sums == 0.0
+            np.divide(stacked, column_sums, out=block, where=~is_empty)
+            np.copyto(block, np.divide(1.0, stacked.shape[1]), where=is_empty)
+            normed = self._unflatten(normed_flat)
+        elif self.IS_AOA:
+            arrays = self.values
+            normed = np.empty(len(arrays), dtype=object)
+
+            # group factors by shape, so each group is normalized in a single pass
+            groups = {}
+            for i, array_i in enumerate(arrays):
+                groups.setdefault(array_i.shape, []).append(i)
+
+            # the output of all groups is carved out of a single buffer
+            size = sum(array_i.size for array_i in arrays)
+            normed_flat = self._get_output("normalize", (size,), reuse_output)
+            offset = 0
+            for shape, indices in groups.items():
+                n_arrays = len(indices)
+                size = n_arrays * int(np.prod(shape))
+                block = normed_flat[offset : offset + size].reshape((n_arrays,) + shape)
+                offset += size
+                np.stack([arrays[i] for i in indices], out=block)
+                column_sums = block.sum(axis=1, keepdims=True)
+                is_empty = column_sums == 0.0
+                np.divide(block, column_sums, out=block, where=~is_empty)
+                np.copyto(block, np.divide(1.0, shape[0]), where=is_empty)
+                for j in range(n_arrays):
+                    normed[indices[j]] = block[j]
+        elif (
+            _normalize_2d_njit is not None
+            and self.values.ndim == 2
+            and self.values.size > _NUMBA_MIN_SIZE
+        ):
+            values = self.values if self._contig else np.ascontiguousarray(self.values)
+            normed = self._get_output("normalize", values.shape, reuse_output)
+            _normalize_2d_njit(values, normed)
         else:
-            normed = np.zeros(self.values.shape)
-            column_sums = np.sum(self.values, axis=0)
-            normed = np.divide(self.values, column_sums)
-            normed[np.isnan(normed)] = np.divide(1.0, normed.shape[0])
+            # columns which sum to zero are set to a uniform distribution
+            column_sums = self.values.sum(axis=0, keepdims=True)
+            is_empty = column_sums == 0.0
+            normed = self._get_output("normalize", self.values.shape, reuse_output)
+            np.divide(self.values, column_sums, out=normed, where=~is_empty)
+            np.copyto(normed, np.divide(1.0, self.values.shape[0]), where=is_empty)
         return normed
 
     def remove_zeros(self):
@@ -130,7 +427,11 @@ class Dirichlet(object):
         exp(-16) is used as the minimum value
 
         """
-        self.values += np.exp(-16)
+        flat = self._flat_values()
+        if flat is not None:
+            flat += _EPS
+        else:
+            self.values += _EPS
 
     def wnorm(self, return_numpy=True):
         """ Expectation of a (log) Categorical distribution parameterized
@@ -138,30 +439,46 @@ class Dirichlet(object):
         e.g. a multi-dimensional likelihood)
         """
 
-        if self.IS_AOA:
-            wA = np.empty(len(self.values), dtype=object)
-            for i in range(len(self.values)):
-                A = Dirichlet(values=self[i].values)
-                A.remove_zeros()
-                A = A.values
-                norm = np.divide(1.0, np.sum(A, axis=0))
-                avg = np.divide(1.0, A)
-                wA[i] = norm - avg
+        stacked = self._stacked_values()
+        flat = self._flat_values()
+        if stacked is not None:
+            # all factors share a shape, so they are computed in a single pass
+            wA_flat = _wnorm(stacked, axis=1).reshape(-1)
             if return_numpy:
-                return wA
+                return self._unflatten(wA_flat)
             else:
-                return Dirichlet(values=wA)
-        else:
-            A = Dirichlet(values=self.values)
-            A.remove_zeros()
-            A = A.values
-            norm = np.divide(1.0, np.sum(A, axis=0))
-            avg = np.divide(1.0, A)
-            wA = norm - avg
+                return self._from_flat(wA_flat)
+        elif flat is not None:
+            A_flat = flat + _EPS
+            A = self._unflatten(A_flat)
+            inv_sums = [np.reciprocal(A_i.sum(axis=0, keepdims=True)) for A_i in A]
+            # `A` is a temporary, so its buffer is reused for the output
+            wA_flat = np.reciprocal(A_flat, out=A_flat)
+            wA = A
+            for i in range(len(wA)):
+                wA_i = wA[i]
+                np.subtract(inv_sums[i], wA_i, out=wA_i)
             if return_numpy:
                 return wA
             else:
-                return Dirichlet(values=wA)
+                return self._from_flat(wA_flat)
+        elif self.IS_AOA:
+            arrays = self.values
+            n_arrays = len(arrays)
+            wA = _empty_like_factors(arrays)
+            for i in range(n_arrays):
+                # `A` is computed directly into the output, then updated in place
+                A = np.add(arrays[i], _EPS, out=wA[i])
+                inv_sum = np.reciprocal(A.sum(axis=0, keepdims=True))
+                inv_A = np.reciprocal(A, out=A)
+                np.subtract(inv_sum, inv_A, out=inv_A)
+        else:
+            wA = _wnorm(self.values)
+
+        if return_numpy:
+            return wA
+        else:
+            return Dirichlet._from_view(wA)
 
     def contains_zeros(self):
         """ Checks if any values are zero
@@ -172,24 +489,64 @@ class Dirichlet(object):
             Whether there are any zeros
 
         """
-        if not self.IS_AOA:
+        # `(values == 0.0).any()` is faster than `not values.all()` (which casts to bool and
+        # does not stop early). `min() == 0` is not equivalent, as e.g. the results of `log`
+        # and `wnorm` can be negative
+        flat = self._flat_values()
+        if flat is not None:
+            return (flat == 0.0).any()
+        elif not self.IS_AOA:
             return (self.values == 0.0).any()
         else:
-            for i in range(len(self.values)):
-                if (self.values[i] == 0.0).any():
-                    return True
-            return False
+            return any((array == 0.0).any() for array in self.values)
 
     def entropy(self, return_numpy=False):
-        pass
+        """ Return the expected entropy of the Categorical distribution parameterized by each column
+
+        Parameters
+        ----------
+        return_numpy: bool
+            Whether to return a :np.ndarray: or :Dirichlet: object
 
-    def log(self, return_numpy=False):
+        Returns
+        ----------
+        np.ndarray or Dirichlet
+            The expected entropy of the columns
+        """
+
+        stacked = self._stacked_values()
+        if stacked is not None:
+            stacked_entropy = _expected_entropy(stacked, axis=1)
+            entropy = np.empty(len(stacked), dtype="object")
+            for i in range(len(stacked)):
+                entropy[i] = stacked_entropy[i]
+        elif not self.IS_AOA:
+            entropy = _expected_entropy(self.values)
+        else:
+            arrays = self.values
+            n_arrays = len(arrays)
+            entropy = np.empty(n_arrays, dtype="object")
+            for i in range(n_arrays):
+                entropy[i] = _expected_entropy(arrays[i])
+
+        if return_numpy:
+            return entropy
+        else:
+            return Dirichlet(values=entropy)
+
+    def log(self, return_numpy=False, reuse_output=False):
         """ Return the log of the parameters
 
+        Exact zeros are clamped to exp(-16) before taking the log; all other values
+        (including negative values, which give NaN) are passed to `np.log` unchanged.
+        The parameters are not modified
+
         Parameters
         ----------
         return_numpy: bool
             Whether to return a :np.ndarray: or :Dirichlet: object
+        reuse_output: bool
+            Whether to write the result into a buffer owned by this Dirichlet (see `normalize`)
 
         Returns
         ----------
@@ -197,26 +554,32 @@ class Dirichlet(object):
             The log of the parameters
         """
 
-        if self.contains_zeros():
-            self.remove_zeros()
-            warnings.warn(
-                "You have called :log: on a Dirichlet that contains zeros. \
-                     We have removed zeros."
-            )
-
-        if not self.IS_AOA:
-            values = np.copy(self.values)
-            log_values = np.log(values)
+        # the parameters are copied into the output buffer (which never aliases `values`),
+        # zeros are clamped, and the log is then taken in place on that buffer
+        flat = self._flat_values()
+        if flat is not None:
+            log_flat = self._get_output("log", flat.shape, reuse_output)
+            _log(flat, log_flat)
+            if return_numpy:
+                return self._unflatten(log_flat)
+            else:
+                return self._from_flat(log_flat)
+        elif not self.IS_AOA:
+            log_values = self._get_output("log", self.values.shape, reuse_output)
+            _log(self.values, log_values)
         else:
-            log_values = np.empty(len(self.values), dtype="object")
-            for i in range(len(self.values)):
-                values = np.copy(self.values[i])
-                log_values[i] = np.log(values)
+            arrays = self.values
+            n_arrays = len(arrays)
+            size = sum(array_i.size for array_i in arrays)
+            log_flat = self._get_output("log", (size,), reuse_output)
+            log_values = _empty_like_factors(arrays, log_flat)
+            for i in range(n_arrays):
+                _log(arrays[i], log_values[i])
 
         if return_numpy:
             return log_values
         else:
-            return Dirichlet(values=log_values)
+            return Dirichlet._from_view(log_values)
 
     def copy(self):
         """Returns a copy of this object
@@ -244,70 +607,143 @@ class Dirichlet(object):
     def shape(self):
         return self.values.shape
 
-    def __add__(self, other):
+    def _arithmetic(self, ufunc, other, inplace=False):
+        """ Apply a binary ufunc to the parameters
+
+        In the `array-of-array` formulation, the ufunc is applied to the whole
+        contiguous buffer when possible, rather than factor-by-factor
+
+        Parameters
+        ----------
+        ufunc: np.ufunc
+            Binary ufunc (e.g. `np.add`)
+        other: Dirichlet or np.ndarray or number
+            The second operand
+        inplace: bool
+            Whether to write the result into the parameters of this Dirichlet
+
+        Returns
+        ----------
+        Dirichlet
+            This Dirichlet if `inplace`, otherwise a new Dirichlet
+        """
         if isinstance(other, Dirichlet):
-            values = self.values + other.values
-            return Dirichlet(values=values)
+            other_values = other.values
         else:
-            values = self.values + other
-            return Dirichlet(values=values)
+            other_values = other
+
+        flat = self._flat_values()
+        if flat is not None:
+            other_flat = None
+            if isinstance(other, Dirichlet) and self._slices == other._slices:
+                other_flat = other._flat_values()
+            elif np.isscalar(other):
+                other_flat = other
+            if other_flat is not None:
+                if inplace:
+                    ufunc(flat, other_flat, out=flat)
+                    return self
+                return self._from_flat(ufunc(flat, other_flat))
 
-    def __radd__(self, other):
-        if isinstance(other, Dirichlet):
-            values = self.values + other.values
-            return Dirichlet(values=values)
+        if self.IS_AOA:
+            # iterate plain lists of factors, rather than indexing the object arrays
+            arrays = self.values.tolist()
+            if isinstance(other_values, np.ndarray) and other_values.dtype == object:
+                others = other_values.tolist()
+            else:
+                others = [other_values] * len(arrays)
+            if inplace:
+                for array_i, other_i in zip(arrays, others):
+                    ufunc(array_i, other_i, out=array_i)
+                return self
+            values = np.empty(len(arrays), dtype=object)
+            for i, (array_i, other_i) in enumerate(zip(arrays, others)):
+                values[i] = ufunc(array_i, other_i)
+        elif inplace:
+            ufunc(self.values, other_values, out=self.values)
+            return self
         else:
-            values = self.values + other
-            return Dirichlet(values=values)
+            values = ufunc(self.values, other_values)
+        return Dirichlet._from_view(values)
+
+    def __add__(self, other):
+        return self._arithmetic(np.add, other)
+
+    def __radd__(self, other):
+        return self._arithmetic(np.add, other)
+
+    def __iadd__(self, other):
+        return self._arithmetic(np.add, other, inplace=True)
 
     def __sub__(self, other):
-        if isinstance(other, Dirichlet):
-            values = self.values - other.values
-            return Dirichlet(values=values)
-        else:
-            values = self.values - other
-            return Dirichlet(values=values)
+        return self._arithmetic(np.subtract, other)
 
     def __rsub__(self, other):
-        if isinstance(other, Dirichlet):
-            values = self.values - other.values
-            return Dirichlet(values=values)
-        else:
-            values = self.values - other
-            return Dirichlet(values=values)
+        return self._arithmetic(np.subtract, other)
+
+    def __isub__(self, other):
+        return self._arithmetic(np.subtract, other, inplace=True)
 
     def __mul__(self, other):
-        if isinstance(other, Dirichlet):
-            values = self.values * other.values
-            return Dirichlet(values=values)
-        else:
-            values = self.values * other
-            return Dirichlet(values=values)
+        return self._arithmetic(np.multiply, other)
 
     def __rmul__(self, other):
-        if isinstance(other, Dirichlet):
-            values = self.values * other.values
-            return Dirichlet(values=values)
-        else:
-            values = self.values * other
-            return Dirichlet(values=values)
+        return self._arithmetic(np.multiply, other)
+
+    def __imul__(self, other):
+        return self._arithmetic(np.multiply, other, inplace=True)
 
     def __contains__(self, value):
         pass
 
     def __getitem__(self, key):
+        # slices are copied (as with `Categorical`), but without re-validating the values
         values = self.values[key]
         if isinstance(values, np.ndarray):
             if values.ndim == 1:
                 values = values[:, np.newaxis]
-            return Dirichlet(values=values)
+            return Dirichlet._from_view(np.array(values, order="C"))
         else:
             return values
 
     def __setitem__(self, idx, value):
         if isinstance(value, Dirichlet):
             value = value.values
-        self.values[idx] = value
+        if (
+            self.IS_AOA
+            and isinstance(idx, (int, np.integer))
+            and self._flat_values() is not None
+            and np.shape(value) == self.values[idx].shape
+        ):
+            # write through to the contiguous buffer, rather than replacing the factor
+            self.values[idx][...] = value
+        elif self.IS_AOA and isinstance(idx, (int, np.integer)):
+            self.values[idx] = np.ascontiguousarray(value, dtype=np.float64)
+        else:
+            self.values[idx] = value
+
+    def __getstate__(self):
+        """ Pickle (and `copy`) the flat buffer, rather than the views into it
+
+        Copied factors would otherwise no longer be views into the copied `_flat`
+        """
+        state = self.__dict__.copy()
+        state["_out_cache"] = {}
+        if self._flat_values() is not None:
+            del state["values"], state["_factors"], state["_stacked"]
+        else:
+            state.update(_flat=None, _slices=[], _factors=[], _stacked=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._flat is not None:
+            self.values = self._unflatten(self._flat)
+            self._factors = list(self.values)
+            self._stacked = None
+            shapes = [shape for _, shape in self._slices]
+            if len(shapes) > 0 and all(shape == shapes[0] for shape in shapes):
+                self._stacked = self._flat.reshape((len(shapes),) + tuple(shapes[0]))
 
     def __repr__(self):
         if not self.IS_AOA:
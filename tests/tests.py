@@ -7,15 +7,19 @@ __author__: Conor Heins, Alexander Tschantz, Brennan Klein
 
 """
 
+import copy
 import os
+import pickle
 import sys
 import unittest
+import warnings
 
 import numpy as np
 from scipy.io import loadmat
 
 sys.path.append(".")
 from inferactively import Categorical, Dirichlet  # nopep8
+from inferactively.distributions.dirichlet import _normalize_2d  # nopep8
 
 
 class TestCategorical(unittest.TestCase):
@@ -544,6 +548,12 @@ class TestDirichlet(unittest.TestCase):
         d = Dirichlet(values=values)
         self.assertEqual(d.values.dtype, np.float64)
 
+    def test_contiguous_conversion(self):
+        values = np.asfortranarray(np.random.rand(3, 2))
+        d = Dirichlet(values=values)
+        self.assertTrue(d.values.flags.c_contiguous)
+        self.assertTrue(np.array_equal(d.values, values))
+
     def test_init_dims_expand(self):
         d = Dirichlet(dims=[5])
         self.assertEqual(d.shape, (5, 1))
@@ -576,6 +586,18 @@ class TestDirichlet(unittest.TestCase):
         self.assertEqual(d[0].shape, (5, 1))
         self.assertEqual(d[1].shape, (4, 1))
 
+    def test_getitem_copy(self):
+        values_1 = np.random.rand(5, 4)
+        values_2 = np.random.rand(4, 3)
+        values = np.array([values_1, values_2], dtype=object)
+        d = Dirichlet(values=values)
+        d_1 = d[1]
+        self.assertFalse(np.shares_memory(d_1.values, d.values[1]))
+        d_1 += 1.0
+        self.assertTrue(np.array_equal(d.values[1], values_2))
+        self.assertEqual(d[1][:, 0].shape, (4, 1))
+        self.assertTrue(d[1][:, 0].values.flags.c_contiguous)
+
     def test_normalize_multi_factor(self):
         values_1 = np.random.rand(5)
         values_2 = np.random.rand(4, 3)
@@ -596,6 +618,64 @@ class TestDirichlet(unittest.TestCase):
         expected_values = np.array([[0.5, 0.5], [0.5, 0.5]])
         self.assertTrue(np.array_equal(d.normalize(), expected_values))
 
+    def test_normalize_empty_column(self):
+        values = np.array([[2.0, 0.0, 0.0], [6.0, 0.0, 0.0], [0.0, 0.0, 0.0]])
+        d = Dirichlet(values=values)
+        normed = d.normalize()
+        self.assertTrue(np.array_equal(normed[:, 0], np.array([0.25, 0.75, 0.0])))
+        self.assertTrue(np.allclose(normed[:, 1:], 1.0 / 3.0))
+
+    def test_normalize_2d_kernel(self):
+        """ tests the (optionally compiled) normalization kernel against the `numpy` path
+        """
+        values = np.random.rand(4, 6)
+        values[:, 2] = 0.0
+        expected = Dirichlet(values=values).normalize()
+        normed = _normalize_2d(values, np.empty_like(values))
+        self.assertTrue(np.allclose(normed, expected))
+        self.assertTrue(np.allclose(normed[:, 2], 0.25))
+
+        strided = values[:, ::2]
+        self.assertFalse(strided.flags.c_contiguous)
+        expected = Dirichlet(values=strided).normalize()
+        normed = _normalize_2d(strided, np.empty(strided.shape))
+        self.assertTrue(np.allclose(normed, expected))
+
+    def test_normalize_reuse_output(self):
+        values = np.random.rand(3, 2)
+        d = Dirichlet(values=values)
+        normed = d.normalize(reuse_output=True)
+        self.assertIs(d.normalize(reuse_output=True), normed)
+        self.assertIsNot(d.normalize(), normed)
+        self.assertTrue(np.allclose(normed, values / values.sum(axis=0)))
+
+    def test_log_reuse_output(self):
+        values = np.random.rand(3, 2)
+        d = Dirichlet(values=values)
+        log_values = d.log(return_numpy=True, reuse_output=True)
+        self.assertIs(d.log(return_numpy=True, reuse_output=True), log_values)
+        self.assertIsNot(d.log(return_numpy=True), log_values)
+        self.assertTrue(np.array_equal(log_values, np.log(values)))
+
+    def test_log_reuse_output_multi_factor(self):
+        values_1 = np.random.rand(5, 4)
+        values_2 = np.random.rand(4, 3)
+        values = np.array([values_1, values_2], dtype=object)
+        d = Dirichlet(values=values)
+        log_values = d.log(return_numpy=True, reuse_output=True)
+        self.assertTrue(
+            np.shares_memory(d.log(return_numpy=True, reuse_output=True)[1], log_values[1])
+        )
+        self.assertTrue(np.array_equal(log_values[1], np.log(values_2)))
+
+        # the per-factor path (when the flat buffer is stale) also reuses its output
+        d[1] = np.random.rand(2, 3)
+        log_values = d.log(return_numpy=True, reuse_output=True)
+        self.assertTrue(
+            np.shares_memory(d.log(return_numpy=True, reuse_output=True)[1], log_values[1])
+        )
+        self.assertTrue(np.array_equal(log_values[1], np.log(d.values[1])))
+
     def test_remove_zeros(self):
         values = np.array([[1.0, 0.0], [1.0, 1.0]])
         d = Dirichlet(values=values)
@@ -611,11 +691,67 @@ class TestDirichlet(unittest.TestCase):
         d = Dirichlet(values=values)
         self.assertFalse(d.contains_zeros())
 
-    # def test_entropy(self):
-    #     values = np.random.rand(3, 2)
-    #     entropy = -np.sum(values * np.log(values), 0) # this needs to be changed, not necessarily equation for entropy of a Dirichlet distribution
-    #     d = Dirichlet(values=values)
-    #     self.assertTrue(np.array_equal(d.entropy(return_numpy=True), entropy))
+    def test_contains_zeros_signed(self):
+        values = np.array([[-1.0, 0.0], [1.0, 1.0]])
+        d = Dirichlet(values=values)
+        self.assertTrue(d.contains_zeros())
+        values_1 = np.array([[-1.0, 2.0], [1.0, 1.0]])
+        values_2 = np.array([[-3.0, 0.0], [1.0, 1.0]])
+        values = np.empty(3, dtype=object)
+        values[0], values[1], values[2] = values_1, values_2, values_1
+        d = Dirichlet(values=values)
+        self.assertTrue(d.contains_zeros())
+        d[1] = values_1
+        self.assertFalse(d.contains_zeros())
+
+    def test_entropy(self):
+        """ the expected entropy of a Categorical under a flat Dirichlet over two outcomes
+        is digamma(3) - digamma(2) = 1 / 2
+        """
+        values = np.ones((2, 3))
+        d = Dirichlet(values=values)
+        entropy = d.entropy(return_numpy=True)
+        self.assertEqual(entropy.shape, (3,))
+        self.assertTrue(np.allclose(entropy, 0.5))
+
+    def test_wnorm_large(self):
+        values = np.random.rand(100, 80)
+        d = Dirichlet(values=values)
+        A = values + np.exp(-16)
+        expected = 1.0 / np.sum(A, axis=0) - 1.0 / A
+        self.assertTrue(np.allclose(d.wnorm(return_numpy=True), expected))
+
+    def test_wnorm_stacked_factors(self):
+        values = np.empty(3, dtype=object)
+        for i in range(len(values)):
+            values[i] = np.random.rand(4, 3)
+        d = Dirichlet(values=values)
+        result_py = d.wnorm(return_numpy=True)
+        for i in range(len(values)):
+            expected = Dirichlet(values=values[i]).wnorm(return_numpy=True)
+            self.assertTrue(np.allclose(result_py[i], expected))
+
+    def test_entropy_zeros(self):
+        d = Dirichlet(dims=[3, 2])
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            entropy = d.entropy(return_numpy=True)
+        self.assertTrue(np.allclose(entropy, 0.0, atol=1e-6))
+        d = Dirichlet(dims=[[2], [2]])
+        entropy = d.entropy(return_numpy=True)
+        self.assertTrue(np.allclose(entropy[0], 0.0, atol=1e-6))
+        self.assertTrue(np.allclose(entropy[1], 0.0, atol=1e-6))
+
+    def test_entropy_multi_factor(self):
+        values_1 = np.ones((2, 3))
+        values_2 = np.random.rand(4, 2) + 1.0
+        values = np.array([values_1, values_2], dtype=object)
+        d = Dirichlet(values=values)
+        entropy = d.entropy(return_numpy=True)
+        self.assertTrue(np.allclose(entropy[0], 0.5))
+        self.assertTrue(
+            np.allclose(entropy[1], Dirichlet(values=values_2).entropy(return_numpy=True))
+        )
 
     def test_log(self):
         values = np.random.rand(3, 2)
@@ -623,6 +759,118 @@ class TestDirichlet(unittest.TestCase):
         d = Dirichlet(values=values)
         self.assertTrue(np.array_equal(d.log(return_numpy=True), log_values))
 
+    def test_log_zeros(self):
+        values = np.array([[1.0, 0.0], [1.0, 1.0]])
+        d = Dirichlet(values=values)
+        log_values = d.log(return_numpy=True)
+        self.assertTrue(np.isfinite(log_values).all())
+        self.assertEqual(log_values[0, 1], -16.0)
+        self.assertTrue(np.array_equal(d.values, values))
+
+    def test_log_small_values(self):
+        """ only exact zeros are clamped, values in (0, exp(-16)) are not
+        """
+        values = np.array([[1e-10], [1.0]])
+        d = Dirichlet(values=values)
+        self.assertTrue(np.array_equal(d.log(return_numpy=True), np.log(values)))
+        values = np.array([[-1.0], [1.0]])
+        d = Dirichlet(values=values)
+        with np.errstate(invalid="ignore"):
+            log_values = d.log(return_numpy=True)
+        self.assertTrue(np.isnan(log_values[0, 0]))
+
+    def test_log_multi_factor(self):
+        values_1 = np.random.rand(5, 4)
+        values_2 = np.random.rand(4)
+        values = np.array([values_1, values_2], dtype=object)
+        d = Dirichlet(values=values)
+        log_values = d.log(return_numpy=True)
+        self.assertTrue(np.array_equal(log_values[0], np.log(values_1)))
+        self.assertTrue(np.array_equal(log_values[1], np.log(values_2)[:, np.newaxis]))
+
+    def test_arithmetic_multi_factor(self):
+        values_1 = np.random.rand(5, 4)
+        values_2 = np.random.rand(4, 3)
+        values = np.array([values_1, values_2], dtype=object)
+        d = Dirichlet(values=values)
+        result = (d + d) * 2.0 - d
+        self.assertTrue(np.allclose(result[0].values, 3.0 * values_1))
+        self.assertTrue(np.allclose(result[1].values, 3.0 * values_2))
+
+    def test_inplace_arithmetic(self):
+        values = np.random.rand(3, 2)
+        d = Dirichlet(values=values)
+        d_values = d.values
+        d += d
+        d *= 2.0
+        d -= values
+        self.assertIs(d.values, d_values)
+        self.assertTrue(np.allclose(d.values, 3.0 * values))
+
+    def test_multi_factor_replaced_values(self):
+        """ replacing `values` invalidates the flat buffer, so the per-factor paths are used
+        """
+        values_1 = np.random.rand(5, 4)
+        values_2 = np.random.rand(4, 3)
+        values = np.array([values_1, values_2], dtype=object)
+        d = Dirichlet(values=values)
+        expected_normed = d.normalize()
+        expected_log = d.log(return_numpy=True)
+        expected_wnorm = d.wnorm(return_numpy=True)
+
+        replaced = np.empty(2, dtype=object)
+        replaced[0], replaced[1] = values_1.copy(), values_2.copy()
+        d.values = replaced
+        self.assertIsNone(d._flat_values())
+        normed = d.normalize()
+        log_values = d.log(return_numpy=True)
+        wnorm_values = d.wnorm(return_numpy=True)
+        for i in range(2):
+            self.assertTrue(np.allclose(normed[i], expected_normed[i]))
+            self.assertTrue(np.array_equal(log_values[i], expected_log[i]))
+            self.assertTrue(np.allclose(wnorm_values[i], expected_wnorm[i]))
+
+    def test_arithmetic_multi_factor_replaced_factor(self):
+        """ replacing a factor with a different shape invalidates the flat buffer,
+        so the per-factor arithmetic path is used
+        """
+        values_1 = np.random.rand(5, 4)
+        values_2 = np.random.rand(4, 3)
+        values = np.array([values_1, values_2], dtype=object)
+        d = Dirichlet(values=values)
+        values_3 = np.random.rand(2, 3)
+        d[1] = values_3.copy()
+        self.assertIsNone(d._flat_values())
+
+        factor = d.values[0]
+        d += d
+        d *= 2.0
+        self.assertIs(d.values[0], factor)
+        self.assertTrue(np.allclose(d.values[0], 4.0 * values_1))
+        self.assertTrue(np.allclose(d.values[1], 4.0 * values_3))
+
+        result = d * Dirichlet(values=np.array([values_1, values_3], dtype=object))
+        self.assertTrue(np.allclose(result.values[0], 4.0 * values_1 ** 2))
+        self.assertTrue(np.allclose(result.values[1], 4.0 * values_3 ** 2))
+
+    def test_multi_factor_deepcopy_pickle(self):
+        """ copies keep their factors as views into their own flat buffer
+        """
+        values = np.empty(2, dtype=object)
+        values[0], values[1] = np.random.rand(5, 4), np.random.rand(5, 4)
+        d = Dirichlet(values=values)
+        for d_copy in [copy.deepcopy(d), pickle.loads(pickle.dumps(d))]:
+            self.assertIsNotNone(d_copy._flat_values())
+            self.assertIsNotNone(d_copy._stacked_values())
+            d_copy += 1.0
+            d_copy.values[0][0, 0] = 100.0
+            normed = d_copy.normalize()
+            for i in range(2):
+                expected = d_copy.values[i] / d_copy.values[i].sum(axis=0)
+                self.assertTrue(np.allclose(normed[i], expected))
+            self.assertTrue(np.allclose(d.values[1], values[1]))
+            self.assertTrue(np.allclose(d_copy.values[1], values[1] + 1.0))
+
     def test_copy(self):
         values = np.random.rand(3, 2)
         d = Dirichlet(values=values)